@@ -13,7 +13,7 @@ from sqlalchemy.orm import Session, joinedload, selectinload
 from .database import get_db
 from .models import Client, Company, Invoice, InvoiceLine, InvoiceSequence
 from .pdf import build_invoice_pdf_payload, render_invoice_pdf
-from .services import compute_line_amounts, compute_totals
+from .services import compute_line_amounts, compute_totals, sort_lines
 
 app = FastAPI()
 templates = Jinja2Templates(directory="app/templates")
@@ -476,11 +476,12 @@ def add_line(
     }
     errors = _validate_line_form(data)
     if errors:
-        lines = sorted(invoice.lines, key=lambda l: (l.sort_order, l.id))
-        totals = compute_totals(invoice, lines)
+        lines = sort_lines(invoice.lines)
+        amounts = compute_line_amounts(lines)
+        totals = compute_totals(invoice, line_amounts=amounts)
         line_amounts = [
             {"line": ln, "subtotal": ls, "discount": ld, "total": lt}
-            for ln, ls, ld, lt in compute_line_amounts(lines)
+            for ln, ls, ld, lt in amounts
         ]
         return templates.TemplateResponse(
             "invoices/detail.html",
@@ -621,7 +622,7 @@ def list_invoices(request: Request, db: Session = Depends(get_db)) -> HTMLRespon
     )
     invoice_totals = {}
     for inv in invoices:
-        lines = sorted(inv.lines, key=lambda l: (l.sort_order, l.id))
+        lines = sort_lines(inv.lines)
         invoice_totals[inv.id] = compute_totals(inv, lines)
     return templates.TemplateResponse(
         "invoices/list.html",
@@ -753,12 +754,13 @@ def invoice_detail(
     if not invoice:
         return HTMLResponse(content="Factura no encontrada", status_code=404)
 
-    lines = sorted(invoice.lines, key=lambda l: (l.sort_order, l.id))
+    lines = sort_lines(invoice.lines)
+    amounts = compute_line_amounts(lines)
     line_amounts = [
         {"line": line, "subtotal": ls, "discount": ld, "total": lt}
-        for line, ls, ld, lt in compute_line_amounts(lines)
+        for line, ls, ld, lt in amounts
     ]
-    totals = compute_totals(invoice, lines)
+    totals = compute_totals(invoice, line_amounts=amounts)
     return templates.TemplateResponse(
         "invoices/detail.html",
         {
@@ -791,7 +793,7 @@ def invoice_pdf(invoice_id: int, request: Request, db: Session = Depends(get_db)
             status_code=status.HTTP_400_BAD_REQUEST,
         )
 
-    lines = sorted(invoice.lines, key=lambda l: (l.sort_order, l.id))
+    lines = sort_lines(invoice.lines)
     payload = build_invoice_pdf_payload(invoice, lines)
     company = _get_company(db)
     pdf_bytes = render_invoice_pdf(payload, company=company, client=invoice.client)
@@ -68,7 +68,7 @@ class Invoice(Base):
         "InvoiceLine",
         cascade="all, delete-orphan",
         back_populates="invoice",
-        order_by="InvoiceLine.sort_order",
+        order_by="(InvoiceLine.sort_order, InvoiceLine.id)",
     )
 
 
@@ -1,63 +1,93 @@
+from collections import namedtuple
 from decimal import Decimal
-from io import BytesIO
-from typing import Dict, Iterable, List, Optional
+from functools import lru_cache
+from operator import attrgetter
+from typing import Dict, List, Optional, Tuple
 
+from reportlab import rl_config
 from reportlab.lib.pagesizes import A4
+from reportlab.pdfbase.pdfmetrics import stringWidth
 from reportlab.pdfgen import canvas
 
 from .models import Client, Company, Invoice, InvoiceLine
-from .services import compute_line_amounts, compute_totals
-
-
-def _pdf_totals(invoice: Invoice, lines: Iterable[InvoiceLine]) -> Dict[str, Decimal]:
-    if invoice.status in ("issued", "paid") and invoice.total_snapshot is not None:
-        subtotal = Decimal(invoice.subtotal_snapshot or 0)
-        igi_amount = Decimal(invoice.igi_amount_snapshot or 0)
-        total = Decimal(invoice.total_snapshot or 0)
-        base = total - igi_amount
-        return {
-            "subtotal": subtotal,
-            "discount": Decimal("0.00"),
-            "base": base,
-            "igi": igi_amount,
-            "total": total,
-        }
-    return compute_totals(invoice, lines)
+from .services import ZERO_MONEY, as_decimal, compute_line_amounts, compute_totals, sort_lines
+
+rl_config.useA85 = 0
+
+_IGI_EXEMPT_FOOTER = (
+    "Operació exempta de l’Impost General Indirecte, d’acord amb l’article 43 de la Llei 11/2012"
+)
+
+_SNAPSHOT_FIELDS = (
+    "client_name_snapshot",
+    "client_tax_id_snapshot",
+    "subtotal_snapshot",
+    "igi_amount_snapshot",
+    "total_snapshot",
+    "igi_rate_snapshot",
+)
+_get_snapshot = attrgetter(*_SNAPSHOT_FIELDS)
+
+_line_fields = attrgetter("description", "qty", "unit_price", "discount_pct")
+
+LineRow = namedtuple(
+    "LineRow", "index description qty unit_price discount_pct total qty_str total_str"
+)
+
+
+def _text_units(text: str, font_name: str) -> int:
+    return round(stringWidth(text, font_name, 1000))
+
+
+@lru_cache(maxsize=4096)
+def _wrap_lines(text: str, max_width: float, font_name: str, font_size: int) -> Tuple[str, ...]:
+    words = text.split()
+    if not words:
+        return ("",)
+    space = _text_units(" ", font_name)
+    widths = [_text_units(word, font_name) for word in words]
+    lines: List[str] = []
+    start = 0
+    current = widths[0]
+    for i in range(1, len(words)):
+        candidate = current + space + widths[i]
+        if candidate * 0.001 * font_size <= max_width:
+            current = candidate
+        else:
+            lines.append(" ".join(words[start:i]))
+            start = i
+            current = widths[i]
+    lines.append(" ".join(words[start:]))
+    return tuple(lines)
+
+
+def wrap_text(text: str, max_width: float, font_name: str = "Helvetica", font_size: int = 9) -> List[str]:
+    return list(_wrap_lines(text, max_width, font_name, font_size))
 
 
 def build_invoice_pdf_payload(invoice: Invoice, lines: List[InvoiceLine]) -> Dict:
-    sorted_lines = sorted(lines, key=lambda l: (l.sort_order, l.id))
+    sorted_lines = sort_lines(lines)
     is_final = invoice.status in ("issued", "paid")
+    line_amounts = compute_line_amounts(sorted_lines)
 
     if is_final:
-        required = {
-            "client_name_snapshot": invoice.client_name_snapshot,
-            "client_tax_id_snapshot": invoice.client_tax_id_snapshot,
-            "subtotal_snapshot": invoice.subtotal_snapshot,
-            "igi_amount_snapshot": invoice.igi_amount_snapshot,
-            "total_snapshot": invoice.total_snapshot,
-            "igi_rate_snapshot": invoice.igi_rate_snapshot,
-        }
-        for field, value in required.items():
-            if value is None:
-                raise ValueError(f"Missing snapshot: {field} for invoice {invoice.id}")
+        snapshot = _get_snapshot(invoice)
+        if None in snapshot:
+            field = _SNAPSHOT_FIELDS[snapshot.index(None)]
+            raise ValueError(f"Missing snapshot: {field} for invoice {invoice.id}")
+        client_name, client_tax_id, subtotal, igi_amount, total, igi_rate = snapshot
+        igi_amount = as_decimal(igi_amount)
+        total = as_decimal(total)
         totals = {
-            "subtotal": Decimal(str(invoice.subtotal_snapshot)),
-            "discount": Decimal("0.00"),
-            "base": Decimal(str(invoice.total_snapshot)) - Decimal(str(invoice.igi_amount_snapshot)),
-            "igi": Decimal(str(invoice.igi_amount_snapshot)),
-            "total": Decimal(str(invoice.total_snapshot)),
+            "subtotal": as_decimal(subtotal),
+            "discount": ZERO_MONEY,
+            "base": total - igi_amount,
+            "igi": igi_amount,
+            "total": total,
         }
+        igi_rate = Decimal(str(igi_rate))
     else:
-        totals = _pdf_totals(invoice, sorted_lines)
-
-    line_amounts = compute_line_amounts(sorted_lines)
-
-    if is_final:
-        client_name = invoice.client_name_snapshot
-        client_tax_id = invoice.client_tax_id_snapshot
-        igi_rate = Decimal(str(invoice.igi_rate_snapshot))
-    else:
+        totals = compute_totals(invoice, line_amounts=line_amounts)
         client_name = invoice.client_name_snapshot or (invoice.client.name if invoice.client else "")
         client_tax_id = invoice.client_tax_id_snapshot or (invoice.client.tax_id if invoice.client else "")
         igi_rate = (
@@ -66,7 +96,24 @@ def build_invoice_pdf_payload(invoice: Invoice, lines: List[InvoiceLine]) -> Dic
             else Decimal(str(invoice.igi_rate))
         )
 
-    show_igi_exempt_footer = igi_rate == Decimal("0")
+    show_igi_exempt_footer = igi_rate == ZERO_MONEY
+
+    line_rows: List[LineRow] = []
+    for idx, (line, _, _, line_total) in enumerate(line_amounts, start=1):
+        description, qty, unit_price, discount_pct = _line_fields(line)
+        qty = as_decimal(qty)
+        line_rows.append(
+            LineRow(
+                idx,
+                description or "",
+                qty,
+                as_decimal(unit_price),
+                as_decimal(discount_pct),
+                line_total,
+                f"{qty:.2f}",
+                f"{line_total:.2f} €",
+            )
+        )
 
     return {
         "invoice_number": invoice.invoice_number or str(invoice.id),
@@ -79,17 +126,12 @@ def build_invoice_pdf_payload(invoice: Invoice, lines: List[InvoiceLine]) -> Dic
         "igi_rate": igi_rate,
         "show_igi_exempt_footer": show_igi_exempt_footer,
         "totals": totals,
-        "lines": [
-            {
-                "index": idx,
-                "description": line.description or "",
-                "qty": Decimal(line.qty or 0),
-                "unit_price": Decimal(line.unit_price or 0),
-                "discount_pct": Decimal(line.discount_pct or 0),
-                "total": line_total,
-            }
-            for idx, (line, _, _, line_total) in enumerate(line_amounts, start=1)
-        ],
+        "totals_strs": {
+            "subtotal": f"Base: {totals['subtotal']:.2f} €",
+            "igi": f"IGI: {totals['igi']:.2f} €",
+            "total": f"TOTAL: {totals['total']:.2f} €",
+        },
+        "lines": line_rows,
     }
 
 
@@ -98,8 +140,7 @@ def render_invoice_pdf(
     company: Optional[Company] = None,
     client: Optional[Client] = None,
 ) -> bytes:
-    buffer = BytesIO()
-    pdf = canvas.Canvas(buffer, pagesize=A4)
+    pdf = canvas.Canvas(None, pagesize=A4, pageCompression=1)
     width, height = A4
 
     margin_x = 40
@@ -108,22 +149,34 @@ def render_invoice_pdf(
     invoice_box_h = 66
     footer_y = 30
 
-    def wrap_text(text: str, max_width: float, font_name: str = "Helvetica", font_size: int = 9) -> List[str]:
-        pdf.setFont(font_name, font_size)
-        words = text.split()
-        lines: List[str] = []
-        current = ""
-        for word in words:
-            candidate = f"{current} {word}".strip()
-            if pdf.stringWidth(candidate, font_name, font_size) <= max_width:
-                current = candidate
-            else:
-                if current:
-                    lines.append(current)
-                current = word
-        if current:
-            lines.append(current)
-        return lines or [""]
+    client_addr = ""
+    if client:
+        client_addr = " ".join(
+            filter(
+                None,
+                (
+                    client.address_line1 or client.address,
+                    client.address_line2,
+                    client.postal_code,
+                    client.city,
+                    client.country,
+                ),
+            )
+        )
+    company_addr = ""
+    if company:
+        company_addr = " ".join(
+            filter(
+                None,
+                (
+                    company.address_line1,
+                    company.address_line2,
+                    company.postal_code,
+                    company.city,
+                    company.country,
+                ),
+            )
+        )
 
     def _draw_bank_details(bottom_limit: float) -> float:
         if not company or not getattr(company, "bank_account", None):
@@ -164,15 +217,7 @@ def render_invoice_pdf(
         lines_count = 3
 
         if client:
-            addr_parts = [
-                client.address_line1 or client.address,
-                client.address_line2,
-                client.postal_code,
-                client.city,
-                client.country,
-            ]
-            addr = " ".join([p for p in addr_parts if p])
-            addr_lines = wrap_text(addr, max_width=box_w - 2 * 8, font_size=9)
+            addr_lines = wrap_text(client_addr, max_width=box_w - 2 * 8, font_size=9)
             lines_count += len(addr_lines)
 
         return max(min_h, pad_top + (lines_count * line_h) + 10)
@@ -190,15 +235,7 @@ def render_invoice_pdf(
         if company.tax_id:
             lines_count += 1
 
-        addr_parts = [
-            company.address_line1,
-            company.address_line2,
-            company.postal_code,
-            company.city,
-            company.country,
-        ]
-        addr = " ".join([p for p in addr_parts if p])
-        addr_lines = wrap_text(addr, max_width=box_w, font_size=8)
+        addr_lines = wrap_text(company_addr, max_width=box_w, font_size=8)
         lines_count += len(addr_lines)
 
         if company.email:
@@ -230,22 +267,13 @@ def render_invoice_pdf(
             pdf.drawString(x, ty, f"NIF: {company.tax_id}")
             ty -= 12
 
-        addr_parts = [
-            company.address_line1,
-            company.address_line2,
-            company.postal_code,
-            company.city,
-            company.country,
-        ]
-        addr = " ".join([p for p in addr_parts if p])
-        for line in wrap_text(addr, max_width=box_w, font_size=8):
+        pdf.setFont("Helvetica", 8)
+        for line in wrap_text(company_addr, max_width=box_w, font_size=8):
             if ty <= bottom_y + 10:
                 break
-            pdf.setFont("Helvetica", 8)
             pdf.drawString(x, ty, line)
             ty -= 10
 
-        pdf.setFont("Helvetica", 8)
         if company.email and ty > bottom_y + 10:
             pdf.drawString(x, ty, company.email)
             ty -= 10
@@ -257,9 +285,6 @@ def render_invoice_pdf(
         pdf.setStrokeColorRGB(0.75, 0.75, 0.75)
         pdf.line(margin_x, bottom_y + 8, width - margin_x, bottom_y + 8)
 
-        pdf.setStrokeColorRGB(0, 0, 0)
-        pdf.setLineWidth(1)
-
         return bottom_y - 4
 
     def draw_company_and_dates(y_pos: float, box_h: int) -> float:
@@ -304,15 +329,7 @@ def render_invoice_pdf(
         ]
 
         if client:
-            addr_parts = [
-                client.address_line1 or client.address,
-                client.address_line2,
-                client.postal_code,
-                client.city,
-                client.country,
-            ]
-            addr = " ".join([p for p in addr_parts if p])
-            addr_lines = wrap_text(addr, max_width=box_w - 2 * pad_x, font_size=9)
+            addr_lines = wrap_text(client_addr, max_width=box_w - 2 * pad_x, font_size=9)
             lines.extend(addr_lines)
 
         pdf.setLineWidth(0.8)
@@ -360,29 +377,45 @@ def render_invoice_pdf(
 
         return min(y_after_client, y_after_invoice)
 
-    y = header_block()
-    y = draw_table_header(y - 6)
-    pdf.setFont("Helvetica", 9)
+    # The page chrome is identical on every page, so it is drawn once into a
+    # Form XObject and referenced from each page.
+    pdf.beginForm("page_header")
+    table_top = draw_table_header(header_block() - 6)
+    pdf.endForm()
+
+    pdf.doForm("page_header")
+    y = table_top
+    # All line items of a page share one text object; wrapped concept lines
+    # advance by the leading and right-aligned columns are placed by width.
+    line_height = 12
+    rows = pdf.beginText()
+    rows.setFont("Helvetica", 9, line_height)
 
     for item in payload["lines"]:
-        concept_lines = wrap_text(item["description"], max_width=360, font_size=9)
-        line_height = 12
+        concept_lines = wrap_text(item.description, max_width=360, font_size=9)
         needed_height = max(line_height * len(concept_lines), line_height) + 4
 
         if y - needed_height < 80:
+            pdf.drawText(rows)
             pdf.showPage()
-            y = header_block()
-            y = draw_table_header(y - 6)
-            pdf.setFont("Helvetica", 9)
+            pdf.doForm("page_header")
+            y = table_top
+            rows = pdf.beginText()
+            rows.setFont("Helvetica", 9, line_height)
 
         start_y = y
-        for idx, text in enumerate(concept_lines):
-            pdf.drawString(margin_x, start_y - (idx * line_height), text)
-
-        pdf.drawRightString(430, start_y, f"{item['qty']:.2f}")
-        pdf.drawRightString(width - margin_x, start_y, f"{item['total']:.2f} €")
+        rows.setTextOrigin(margin_x, start_y)
+        for text in concept_lines:
+            rows.textLine(text)
+
+        rows.setTextOrigin(430 - stringWidth(item.qty_str, "Helvetica", 9), start_y)
+        rows.textLine(item.qty_str)
+        rows.setTextOrigin(width - margin_x - stringWidth(item.total_str, "Helvetica", 9), start_y)
+        rows.textLine(item.total_str)
         y = start_y - needed_height
 
+    pdf.drawText(rows)
+
     totals_box_w = invoice_box_w
     totals_box_x = width - margin_x - totals_box_w
     bank_box_w = width - 2 * margin_x - totals_box_w - gap
@@ -441,14 +474,14 @@ def render_invoice_pdf(
     pdf.drawRightString(
         totals_box_x + totals_box_w - pad_x,
         y_cursor,
-        f"Base: {payload['totals']['subtotal']:.2f} €",
+        payload["totals_strs"]["subtotal"],
     )
     y_cursor -= 14
 
     pdf.drawRightString(
         totals_box_x + totals_box_w - pad_x,
         y_cursor,
-        f"IGI: {payload['totals']['igi']:.2f} €",
+        payload["totals_strs"]["igi"],
     )
     y_cursor -= 18
 
@@ -456,7 +489,7 @@ def render_invoice_pdf(
     pdf.drawRightString(
         totals_box_x + totals_box_w - pad_x,
         y_cursor,
-        f"TOTAL: {payload['totals']['total']:.2f} €",
+        payload["totals_strs"]["total"],
     )
 
     if payload.get("show_igi_exempt_footer"):
@@ -464,15 +497,7 @@ def render_invoice_pdf(
         pdf.setStrokeColorRGB(0.75, 0.75, 0.75)
         pdf.line(margin_x, footer_y + 14, width - margin_x, footer_y + 14)
 
-        pdf.setStrokeColorRGB(0, 0, 0)
-        pdf.setLineWidth(1)
-
         pdf.setFont("Helvetica", 8)
-        footer_text = (
-            "Operació exempta de l’Impost General Indirecte, d’acord amb l’article 43 de la Llei 11/2012"
-        )
-        pdf.drawCentredString(width / 2, footer_y, footer_text)
+        pdf.drawCentredString(width / 2, footer_y, _IGI_EXEMPT_FOOTER)
 
-    pdf.save()
-    buffer.seek(0)
-    return buffer.getvalue()
+    return pdf.getpdfdata()
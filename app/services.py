@@ -1,36 +1,64 @@
 from decimal import Decimal, ROUND_HALF_UP
-from typing import Iterable, List, Tuple
+from operator import attrgetter
+from typing import Iterable, List, Optional, Tuple
 
 from .models import Invoice, InvoiceLine
 
+_Q = Decimal("0.01")
+_ZERO = Decimal("0")
+ZERO_MONEY = Decimal("0.00")
+_HUNDRED = Decimal("100")
+
+_line_sort_key = attrgetter("sort_order", "id")
+
 
 def money_round(value: Decimal) -> Decimal:
-    return value.quantize(Decimal("0.01"), rounding=ROUND_HALF_UP)
+    return value.quantize(_Q, rounding=ROUND_HALF_UP)
+
+
+def sort_lines(lines: Iterable[InvoiceLine]) -> List[InvoiceLine]:
+    return sorted(lines, key=_line_sort_key)
+
+
+def as_decimal(value) -> Decimal:
+    if value.__class__ is Decimal:
+        return value
+    return Decimal(str(value)) if value else ZERO_MONEY
 
 
 def compute_line_amounts(lines: Iterable[InvoiceLine]) -> List[Tuple[InvoiceLine, Decimal, Decimal, Decimal]]:
     result = []
     for line in lines:
-        qty = Decimal(line.qty or 0)
-        price = Decimal(line.unit_price or 0)
-        discount_pct = Decimal(line.discount_pct or 0)
-        line_subtotal = money_round(qty * price)
-        line_discount = money_round(line_subtotal * (discount_pct / Decimal("100")))
-        line_total = money_round(line_subtotal - line_discount)
+        line_subtotal = money_round(as_decimal(line.qty) * as_decimal(line.unit_price))
+        discount_pct = line.discount_pct
+        if discount_pct:
+            line_discount = money_round(line_subtotal * (as_decimal(discount_pct) / _HUNDRED))
+            # Both operands are already rounded to cents, so the difference is exact.
+            line_total = line_subtotal - line_discount
+        else:
+            line_discount = ZERO_MONEY
+            line_total = line_subtotal
         result.append((line, line_subtotal, line_discount, line_total))
     return result
 
 
-def compute_totals(invoice: Invoice, lines: Iterable[InvoiceLine]):
-    subtotal = Decimal("0")
-    discount_total = Decimal("0")
-    for _, line_subtotal, line_discount, _ in compute_line_amounts(lines):
+def compute_totals(
+    invoice: Invoice,
+    lines: Optional[Iterable[InvoiceLine]] = None,
+    *,
+    line_amounts: Optional[List[Tuple[InvoiceLine, Decimal, Decimal, Decimal]]] = None,
+):
+    if line_amounts is None:
+        line_amounts = compute_line_amounts(lines)
+    subtotal = _ZERO
+    discount_total = _ZERO
+    for _, line_subtotal, line_discount, _ in line_amounts:
         subtotal += line_subtotal
         discount_total += line_discount
 
     base = subtotal - discount_total
-    igi_rate = Decimal(invoice.igi_rate or 0)
-    igi_amount = money_round(base * (igi_rate / Decimal("100")))
+    igi_rate = as_decimal(invoice.igi_rate)
+    igi_amount = money_round(base * (igi_rate / _HUNDRED))
     total = money_round(base + igi_amount)
 
     return {
@@ -1,30 +1,30 @@
-import os
 import sys
-import tempfile
 from datetime import date
 from pathlib import Path
 
 import pytest
 from fastapi.testclient import TestClient
-from sqlalchemy import create_engine, event
+from jinja2 import FileSystemBytecodeCache
+from sqlalchemy import create_engine, event, insert
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
 
 ROOT_DIR = Path(__file__).resolve().parents[1]
 if str(ROOT_DIR) not in sys.path:
     sys.path.insert(0, str(ROOT_DIR))
 
 from app.database import Base, get_db  # noqa: E402
-from app.main import app  # noqa: E402
+from app.main import app, templates  # noqa: E402
 from app import models  # noqa: F401,E402  ensure models are imported
+from app.models import Client  # noqa: E402
 
 
 @pytest.fixture(scope="session")
 def engine():
-    fd, path = tempfile.mkstemp()
-    os.close(fd)
-    test_db_url = f"sqlite:///{path}"
     engine = create_engine(
-        test_db_url, connect_args={"check_same_thread": False}
+        "sqlite://",
+        connect_args={"check_same_thread": False},
+        poolclass=StaticPool,
     )
 
     @event.listens_for(engine, "connect")
@@ -32,37 +32,67 @@ def engine():
         cursor = dbapi_connection.cursor()
         cursor.execute("PRAGMA foreign_keys=ON")
         cursor.close()
+        # Let SQLAlchemy emit BEGIN itself so SAVEPOINTs behave under pysqlite.
+        dbapi_connection.isolation_level = None
 
+    @event.listens_for(engine, "begin")
+    def do_begin(conn):
+        conn.exec_driver_sql("BEGIN")
+
+    Base.metadata.create_all(bind=engine)
     yield engine
     engine.dispose()
-    if os.path.exists(path):
-        os.unlink(path)
 
 
 @pytest.fixture(scope="session")
-def SessionTesting(engine):
-    return sessionmaker(autocommit=False, autoflush=False, bind=engine)
-
-
-@pytest.fixture(autouse=True)
-def prepare_db(engine, SessionTesting):
-    Base.metadata.drop_all(bind=engine)
-    Base.metadata.create_all(bind=engine)
-    yield
-    Base.metadata.drop_all(bind=engine)
+def SessionTesting():
+    return sessionmaker(
+        autocommit=False,
+        autoflush=False,
+        join_transaction_mode="create_savepoint",
+    )
 
 
 @pytest.fixture
-def db_session(SessionTesting):
-    session = SessionTesting()
+def db_session(engine, SessionTesting):
+    connection = engine.connect()
+    transaction = connection.begin()
+    session = SessionTesting(bind=connection)
     try:
         yield session
     finally:
         session.close()
+        transaction.rollback()
+        connection.close()
 
 
 @pytest.fixture
-def client(db_session):
+def make_clients(db_session):
+    def _make_clients(*names, **overrides):
+        rows = [{"name": name, "tax_id": None, **overrides} for name in names]
+        ids = db_session.scalars(
+            insert(Client).returning(Client.id, sort_by_parameter_order=True), rows
+        ).all()
+        db_session.commit()
+        return ids
+
+    return _make_clients
+
+
+@pytest.fixture(scope="session")
+def _app_client(pytestconfig):
+    # Keep compiled templates in pytest's cache dir so later runs skip
+    # compilation; templates do not change while the suite runs.
+    cache = getattr(pytestconfig, "cache", None)
+    if cache is not None:
+        templates.env.bytecode_cache = FileSystemBytecodeCache(str(cache.mkdir("jinja")))
+    templates.env.auto_reload = False
+    with TestClient(app) as c:
+        yield c
+
+
+@pytest.fixture
+def client(_app_client, db_session):
     def override_get_db():
         try:
             yield db_session
@@ -70,9 +100,11 @@ def client(db_session):
             pass
 
     app.dependency_overrides[get_db] = override_get_db
-    with TestClient(app) as c:
-        yield c
-    app.dependency_overrides.clear()
+    try:
+        yield _app_client
+    finally:
+        app.dependency_overrides.clear()
+        _app_client.cookies.clear()
 
 
 @pytest.fixture
@@ -0,0 +1,2 @@
+def new_invoice_id(resp) -> int:
+    return int(resp.headers["location"].rsplit("/", 1)[-1])
@@ -1,8 +1,14 @@
 from datetime import date
 
+from sqlalchemy import select
+
 from app.models import Client, Invoice
 
 
+def _is_deleted(db_session, client_id):
+    return db_session.scalar(select(Client.is_deleted).where(Client.id == client_id))
+
+
 def test_create_client(client, db_session):
     resp = client.post(
         "/clients",
@@ -28,15 +34,12 @@ def test_create_client(client, db_session):
     assert list_resp.status_code == 200
 
 
-def test_delete_client_without_invoices(client, db_session):
-    c = Client(name="Solo", tax_id=None)
-    db_session.add(c)
-    db_session.commit()
+def test_delete_client_without_invoices(client, db_session, make_clients):
+    (client_id,) = make_clients("Solo")
 
-    resp = client.post(f"/clients/{c.id}/delete", follow_redirects=False)
+    resp = client.post(f"/clients/{client_id}/delete", follow_redirects=False)
     assert resp.status_code in (302, 303)
-    db_session.refresh(c)
-    assert c.is_deleted is True
+    assert _is_deleted(db_session, client_id) is True
     # No debe aparecer en listado activo
     resp_list = client.get("/clients")
     assert "Solo" not in resp_list.text
@@ -65,15 +68,11 @@ def test_delete_client_with_invoices_blocked(client, db_session):
 
     resp = client.post(f"/clients/{c.id}/delete", follow_redirects=False)
     assert resp.status_code in (302, 303)
-    db_session.refresh(c)
-    assert c.is_deleted is True
+    assert _is_deleted(db_session, c.id) is True
 
 
-def test_clients_list_order_desc(client, db_session):
-    older = Client(name="Old", tax_id=None)
-    newer = Client(name="New", tax_id=None)
-    db_session.add_all([older, newer])
-    db_session.commit()
+def test_clients_list_order_desc(client, make_clients):
+    make_clients("Old", "New")
 
     resp = client.get("/clients")
     assert resp.status_code == 200
@@ -83,15 +82,12 @@ def test_clients_list_order_desc(client, db_session):
     assert pos_new < pos_old  # newer appears first
 
 
-def test_restore_deleted_client(client, db_session):
-    c = Client(name="RestoreMe", tax_id=None, is_deleted=True)
-    db_session.add(c)
-    db_session.commit()
+def test_restore_deleted_client(client, db_session, make_clients):
+    (client_id,) = make_clients("RestoreMe", is_deleted=True)
 
-    resp = client.post(f"/clients/{c.id}/restore", follow_redirects=False)
+    resp = client.post(f"/clients/{client_id}/restore", follow_redirects=False)
     assert resp.status_code in (302, 303)
-    db_session.refresh(c)
-    assert c.is_deleted is False
+    assert _is_deleted(db_session, client_id) is False
     active = client.get("/clients")
     assert "RestoreMe" in active.text
 
@@ -116,15 +112,12 @@ def test_soft_delete_client_with_invoices_is_allowed(client, db_session):
 
     resp = client.post(f"/clients/{c.id}/delete", follow_redirects=False)
     assert resp.status_code in (302, 303)
-    db_session.refresh(c)
-    assert c.is_deleted is True
+    assert _is_deleted(db_session, c.id) is True
 
 
-def test_deleted_client_not_listed_in_clients_index(client, db_session):
-    c = Client(name="HideMe", tax_id=None)
-    db_session.add(c)
-    db_session.commit()
-    client.post(f"/clients/{c.id}/delete", follow_redirects=False)
+def test_deleted_client_not_listed_in_clients_index(client, make_clients):
+    (client_id,) = make_clients("HideMe")
+    client.post(f"/clients/{client_id}/delete", follow_redirects=False)
 
     resp_active = client.get("/clients")
     assert "HideMe" not in resp_active.text
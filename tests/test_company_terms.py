@@ -2,6 +2,8 @@ from datetime import date, timedelta
 
 from app.models import Client, Company, Invoice
 
+from helpers import new_invoice_id
+
 
 def test_company_payment_terms_fallback(client, db_session):
     company = Company(name="Comp", payment_terms_days=10)
@@ -30,7 +32,7 @@ def test_company_payment_terms_fallback(client, db_session):
         follow_redirects=False,
     )
     assert resp_inv.status_code in (302, 303)
-    inv = db_session.query(Invoice).order_by(Invoice.id.desc()).first()
+    inv = db_session.get(Invoice, new_invoice_id(resp_inv))
     assert inv.due_date == issue + timedelta(days=10)
 
 
@@ -61,5 +63,5 @@ def test_client_payment_terms_override_company(client, db_session):
         follow_redirects=False,
     )
     assert resp_inv.status_code in (302, 303)
-    inv = db_session.query(Invoice).order_by(Invoice.id.desc()).first()
+    inv = db_session.get(Invoice, new_invoice_id(resp_inv))
     assert inv.due_date == issue + timedelta(days=5)
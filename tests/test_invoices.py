@@ -1,22 +1,58 @@
-from datetime import date, timedelta
+from datetime import date
+from decimal import Decimal
+
+import pytest
 
 from app.models import Client, Invoice, InvoiceLine
+from app.services import compute_line_amounts, compute_totals
+
+from helpers import new_invoice_id
+
 
+@pytest.fixture
+def base_client_id(make_clients):
+    (client_id,) = make_clients("ClientX", tax_id="TX")
+    return client_id
 
-def create_client(db_session, name="ClientX"):
-    c = Client(name=name, tax_id="TX")
-    db_session.add(c)
+
+def _make_invoice(db_session, client_id: int, issue_date: date):
+    inv = Invoice(
+        status="draft",
+        issue_date=issue_date,
+        due_date=issue_date,
+        client_id=client_id,
+        currency="EUR",
+        igi_rate=Decimal("0"),
+        notes="",
+    )
+    db_session.add(inv)
+    db_session.commit()
+    return inv
+
+
+def _seed_lines(db_session, invoice_id, descriptions):
+    db_session.add_all(
+        [
+            InvoiceLine(
+                invoice_id=invoice_id,
+                description=description,
+                qty=Decimal("1"),
+                unit_price=Decimal("1"),
+                discount_pct=Decimal("0"),
+                sort_order=i,
+            )
+            for i, description in enumerate(descriptions, start=1)
+        ]
+    )
     db_session.commit()
-    return c
 
 
-def test_create_invoice_draft(client, db_session):
-    c = create_client(db_session)
+def test_create_invoice_draft(client, db_session, base_client_id):
     issue = date.today()
     resp = client.post(
         "/invoices/new",
         data={
-            "client_id": str(c.id),
+            "client_id": str(base_client_id),
             "issue_date": issue.isoformat(),
             "currency": "EUR",
             "igi_rate": "0",
@@ -25,7 +61,7 @@ def test_create_invoice_draft(client, db_session):
         follow_redirects=False,
     )
     assert resp.status_code in (302, 303)
-    inv = db_session.query(Invoice).order_by(Invoice.id.desc()).first()
+    inv = db_session.get(Invoice, new_invoice_id(resp))
     assert inv.status == "draft"
     assert inv.issue_date == issue
     assert inv.due_date == issue  # fallback 0 days
@@ -39,49 +75,24 @@ def test_client_select_excludes_deleted(client, db_session):
     resp = client.get("/invoices/new")
     assert resp.status_code == 200
     body = resp.text
-    assert "Active" in body
-    assert "Deleted" not in body
+    assert f'<option value="{c1.id}"' in body
+    assert ">Active</option>" in body
+    assert f'<option value="{c2.id}"' not in body
 
 
-def test_issue_invoice(client, db_session):
-    c = create_client(db_session)
-    client.post(
-        "/invoices/new",
-        data={
-            "client_id": str(c.id),
-            "issue_date": date.today().isoformat(),
-            "currency": "EUR",
-            "igi_rate": "0",
-            "notes": "",
-        },
-        follow_redirects=False,
-    )
-    inv = db_session.query(Invoice).order_by(Invoice.id.desc()).first()
+def test_issue_invoice(client, db_session, base_client_id):
+    inv = _make_invoice(db_session, base_client_id, date.today())
     resp = client.post(f"/invoices/{inv.id}/issue", follow_redirects=False)
     assert resp.status_code in (302, 303, 400)
-    db_session.refresh(inv)
     if not inv.lines:
         assert resp.status_code == 400
     else:
         assert inv.status == "issued"
 
 
-def test_add_line_rejected_when_issued(client, db_session):
-    c = create_client(db_session)
-    client.post(
-        "/invoices/new",
-        data={
-            "client_id": str(c.id),
-            "issue_date": date.today().isoformat(),
-            "currency": "EUR",
-            "igi_rate": "0",
-            "notes": "",
-        },
-        follow_redirects=False,
-    )
-    inv = db_session.query(Invoice).order_by(Invoice.id.desc()).first()
+def test_add_line_rejected_when_issued(client, db_session, base_client_id):
+    inv = _make_invoice(db_session, base_client_id, date.today())
     # make it issued without lines
-    db_session.refresh(inv)
     inv.status = "issued"
     db_session.commit()
     resp = client.post(
@@ -93,20 +104,8 @@ def test_add_line_rejected_when_issued(client, db_session):
     assert db_session.query(InvoiceLine).filter_by(invoice_id=inv.id).count() == 0
 
 
-def test_delete_line_rejected_when_issued(client, db_session):
-    c = create_client(db_session)
-    client.post(
-        "/invoices/new",
-        data={
-            "client_id": str(c.id),
-            "issue_date": date.today().isoformat(),
-            "currency": "EUR",
-            "igi_rate": "0",
-            "notes": "",
-        },
-        follow_redirects=False,
-    )
-    inv = db_session.query(Invoice).order_by(Invoice.id.desc()).first()
+def test_delete_line_rejected_when_issued(client, db_session, base_client_id):
+    inv = _make_invoice(db_session, base_client_id, date.today())
     line = InvoiceLine(
         invoice_id=inv.id, description="l1", qty=1, unit_price=1, discount_pct=0, sort_order=1
     )
@@ -122,20 +121,8 @@ def test_delete_line_rejected_when_issued(client, db_session):
     assert db_session.query(InvoiceLine).filter_by(id=line.id).first() is not None
 
 
-def test_add_lines_sort_order_and_append(client, db_session):
-    c = create_client(db_session)
-    client.post(
-        "/invoices/new",
-        data={
-            "client_id": str(c.id),
-            "issue_date": date.today().isoformat(),
-            "currency": "EUR",
-            "igi_rate": "0",
-            "notes": "",
-        },
-        follow_redirects=False,
-    )
-    inv = db_session.query(Invoice).order_by(Invoice.id.desc()).first()
+def test_add_lines_sort_order_and_append(client, db_session, base_client_id):
+    inv = _make_invoice(db_session, base_client_id, date.today())
 
     for i in range(3):
         resp = client.post(
@@ -167,135 +154,96 @@ def test_add_lines_sort_order_and_append(client, db_session):
     assert orders == sorted(orders)
 
 
-def test_line_validations(client, db_session):
-    c = create_client(db_session)
-    client.post(
-        "/invoices/new",
-        data={
-            "client_id": str(c.id),
-            "issue_date": date.today().isoformat(),
-            "currency": "EUR",
-            "igi_rate": "0",
-            "notes": "",
-        },
-        follow_redirects=False,
-    )
-    inv = db_session.query(Invoice).order_by(Invoice.id.desc()).first()
+@pytest.fixture
+def draft_invoice_id(db_session, base_client_id):
+    return _make_invoice(db_session, base_client_id, date.today()).id
 
-    bad_cases = [
+
+@pytest.mark.parametrize(
+    "data",
+    [
         {"description": "bad", "qty": "0", "unit_price": "1", "discount_pct": "0"},
         {"description": "bad", "qty": "1", "unit_price": "-1", "discount_pct": "0"},
         {"description": "bad", "qty": "1", "unit_price": "1", "discount_pct": "-1"},
         {"description": "bad", "qty": "1", "unit_price": "1", "discount_pct": "101"},
-    ]
-    for data in bad_cases:
-        resp = client.post(f"/invoices/{inv.id}/lines", data=data, follow_redirects=False)
-        assert resp.status_code == 400
-    assert db_session.query(InvoiceLine).filter_by(invoice_id=inv.id).count() == 0
+    ],
+    ids=["qty_zero", "negative_price", "negative_discount", "discount_over_100"],
+)
+def test_line_validations(client, db_session, draft_invoice_id, data):
+    resp = client.post(f"/invoices/{draft_invoice_id}/lines", data=data, follow_redirects=False)
+    assert resp.status_code == 400
+    assert db_session.query(InvoiceLine).filter_by(invoice_id=draft_invoice_id).count() == 0
 
 
-def test_delete_invoice_cascades_lines(client, db_session):
-    c = create_client(db_session)
-    client.post(
-        "/invoices/new",
-        data={
-            "client_id": str(c.id),
-            "issue_date": date.today().isoformat(),
-            "currency": "EUR",
-            "igi_rate": "0",
-            "notes": "",
-        },
-        follow_redirects=False,
-    )
-    inv = db_session.query(Invoice).order_by(Invoice.id.desc()).first()
-    client.post(
-        f"/invoices/{inv.id}/lines",
-        data={"description": "l1", "qty": "1", "unit_price": "2", "discount_pct": "0"},
-        follow_redirects=False,
-    )
+def test_delete_invoice_cascades_lines(client, db_session, base_client_id):
+    inv = _make_invoice(db_session, base_client_id, date.today())
+    _seed_lines(db_session, inv.id, ["l1"])
     client.post(f"/invoices/{inv.id}/delete", follow_redirects=False)
     assert db_session.query(Invoice).filter_by(id=inv.id).first() is None
     assert db_session.query(InvoiceLine).filter_by(invoice_id=inv.id).count() == 0
 
 
-def test_smoke_pages(client, db_session):
+def test_smoke_pages(client, db_session, base_client_id):
     assert client.get("/clients").status_code == 200
     assert client.get("/invoices").status_code == 200
 
-    c = create_client(db_session)
-    client.post(
-        "/invoices/new",
-        data={
-            "client_id": str(c.id),
-            "issue_date": date.today().isoformat(),
-            "currency": "EUR",
-            "igi_rate": "0",
-            "notes": "",
-        },
-        follow_redirects=False,
-    )
-    inv = db_session.query(Invoice).order_by(Invoice.id.desc()).first()
+    inv = _make_invoice(db_session, base_client_id, date.today())
     assert client.get(f"/invoices/{inv.id}").status_code == 200
 
 
-def _create_invoice_with_date(client, db_session, issue_date: date):
-    c = create_client(db_session)
-    client.post(
-        "/invoices/new",
-        data={
-            "client_id": str(c.id),
-            "issue_date": issue_date.isoformat(),
-            "currency": "EUR",
-            "igi_rate": "0",
-            "notes": "",
-        },
-        follow_redirects=False,
-    )
-    inv = db_session.query(Invoice).order_by(Invoice.id.desc()).first()
-    client.post(
-        f"/invoices/{inv.id}/lines",
-        data={"description": "l1", "qty": "1", "unit_price": "1", "discount_pct": "0"},
-        follow_redirects=False,
-    )
-    return db_session.get(Invoice, inv.id)
+def _create_invoice_with_date(db_session, client_id: int, issue_date: date):
+    inv = _make_invoice(db_session, client_id, issue_date)
+    _seed_lines(db_session, inv.id, ["l1"])
+    return inv
 
 
-def test_issue_assigns_number_format_TCYYNN(client, db_session):
-    inv = _create_invoice_with_date(client, db_session, date(2026, 1, 15))
+def test_issue_assigns_number_format_TCYYNN(client, db_session, base_client_id):
+    inv = _create_invoice_with_date(db_session, base_client_id, date(2026, 1, 15))
     resp = client.post(f"/invoices/{inv.id}/issue", follow_redirects=False)
     assert resp.status_code in (302, 303)
-    db_session.refresh(inv)
     assert inv.invoice_number == "TC2601"
 
 
-def test_sequence_increments_same_year(client, db_session):
-    inv1 = _create_invoice_with_date(client, db_session, date(2026, 2, 1))
-    inv2 = _create_invoice_with_date(client, db_session, date(2026, 3, 1))
+def test_sequence_increments_same_year(client, db_session, base_client_id):
+    inv1 = _create_invoice_with_date(db_session, base_client_id, date(2026, 2, 1))
+    inv2 = _create_invoice_with_date(db_session, base_client_id, date(2026, 3, 1))
     client.post(f"/invoices/{inv1.id}/issue", follow_redirects=False)
     client.post(f"/invoices/{inv2.id}/issue", follow_redirects=False)
-    db_session.refresh(inv1)
-    db_session.refresh(inv2)
     assert inv1.invoice_number == "TC2601"
     assert inv2.invoice_number == "TC2602"
 
 
-def test_sequence_resets_next_year(client, db_session):
-    inv1 = _create_invoice_with_date(client, db_session, date(2026, 5, 1))
-    inv2 = _create_invoice_with_date(client, db_session, date(2027, 1, 1))
+def test_sequence_resets_next_year(client, db_session, base_client_id):
+    inv1 = _create_invoice_with_date(db_session, base_client_id, date(2026, 5, 1))
+    inv2 = _create_invoice_with_date(db_session, base_client_id, date(2027, 1, 1))
     client.post(f"/invoices/{inv1.id}/issue", follow_redirects=False)
     client.post(f"/invoices/{inv2.id}/issue", follow_redirects=False)
-    db_session.refresh(inv1)
-    db_session.refresh(inv2)
     assert inv1.invoice_number == "TC2601"
     assert inv2.invoice_number == "TC2701"
 
 
-def test_reissue_idempotent_keeps_number(client, db_session):
-    inv = _create_invoice_with_date(client, db_session, date(2026, 6, 1))
+def test_reissue_idempotent_keeps_number(client, db_session, base_client_id):
+    inv = _create_invoice_with_date(db_session, base_client_id, date(2026, 6, 1))
     client.post(f"/invoices/{inv.id}/issue", follow_redirects=False)
-    db_session.refresh(inv)
     number_first = inv.invoice_number
     resp = client.post(f"/invoices/{inv.id}/issue", follow_redirects=False)
     assert resp.status_code in (302, 303)
-    db_session.refresh(inv)
     assert inv.invoice_number == number_first
+
+
+def test_line_amounts_round_half_up():
+    lines = [
+        InvoiceLine(description="a", qty=Decimal("3"), unit_price=Decimal("0.335"), discount_pct=Decimal("0")),
+        InvoiceLine(description="b", qty=Decimal("1"), unit_price=Decimal("10.05"), discount_pct=Decimal("5")),
+    ]
+    amounts = compute_line_amounts(lines)
+    assert [a[1:] for a in amounts] == [
+        (Decimal("1.01"), Decimal("0.00"), Decimal("1.01")),
+        (Decimal("10.05"), Decimal("0.50"), Decimal("9.55")),
+    ]
+    invoice = Invoice(igi_rate=Decimal("4.5"))
+    totals = compute_totals(invoice, lines)
+    assert totals["base"] == Decimal("10.56")
+    assert totals["igi"] == Decimal("0.48")
+    assert totals["total"] == Decimal("11.04")
+    assert compute_totals(invoice, line_amounts=amounts) == totals
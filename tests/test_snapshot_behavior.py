@@ -1,114 +1,93 @@
 from datetime import date
-
-from app.models import Client, Invoice, InvoiceLine
-
-
-def _create_company(client):
-    return client.post(
-        "/company",
-        data={
-            "name": "Comp A",
-            "tax_id": "TA",
-            "phone": "",
-            "address_line1": "",
-            "address_line2": "",
-            "city": "",
-            "postal_code": "",
-            "country": "",
-            "email": "",
-            "bank_account": "",
-            "bank_swift": "",
-            "payment_terms_days": "",
-            "notes": "",
-        },
-        follow_redirects=False,
-    )
-
-
-def _create_client_via_form(client, name="Client A"):
-    resp = client.post(
-        "/clients",
-        data={
-            "name": name,
-            "tax_id": "TX",
-            "address_line1": "",
-            "address_line2": "",
-            "city": "",
-            "postal_code": "",
-            "country": "",
-            "phone": "",
-            "email": "",
-            "payment_terms_days": "",
-        },
-        follow_redirects=False,
+from decimal import Decimal
+from urllib.parse import urlencode
+
+import pytest
+
+from app.models import Client, Company, Invoice, InvoiceLine
+
+_FORM_HEADERS = {"content-type": "application/x-www-form-urlencoded"}
+_CLIENT_FORM_BLANKS = {
+    "address_line1": "",
+    "address_line2": "",
+    "city": "",
+    "postal_code": "",
+    "country": "",
+    "phone": "",
+    "email": "",
+    "payment_terms_days": "",
+}
+# Encoded once: the client edit posts only differ in name and tax id.
+_RENAME_MODIFICADO = urlencode(
+    {"name": "Cliente Modificado", "tax_id": "TX2", **_CLIENT_FORM_BLANKS}
+).encode()
+_RENAME_CAMBIADO = urlencode(
+    {"name": "Cliente Cambiado", "tax_id": "TX3", **_CLIENT_FORM_BLANKS}
+).encode()
+
+
+def _seed_invoice(db_session, issue_date: date, client_name: str) -> Invoice:
+    invoice = Invoice(
+        status="draft",
+        issue_date=issue_date,
+        due_date=issue_date,
+        client=Client(name=client_name, tax_id="TX"),
+        currency="EUR",
+        igi_rate=Decimal("0"),
+        notes="",
+        lines=[
+            InvoiceLine(
+                description="L1",
+                qty=Decimal("1"),
+                unit_price=Decimal("10"),
+                discount_pct=Decimal("0"),
+                sort_order=1,
+            )
+        ],
     )
-    assert resp.status_code in (302, 303)
-    return name
-
-
-def _create_invoice_with_line(client, db_session, issue_date: date, client_obj: Client):
-    resp = client.post(
-        "/invoices/new",
-        data={
-            "client_id": str(client_obj.id),
-            "issue_date": issue_date.isoformat(),
-            "currency": "EUR",
-            "igi_rate": "0",
-            "notes": "",
-        },
-        follow_redirects=False,
-    )
-    assert resp.status_code in (302, 303)
-    inv = db_session.query(Invoice).order_by(Invoice.id.desc()).first()
-    # create line
-    client.post(
-        f"/invoices/{inv.id}/lines",
-        data={"description": "L1", "qty": "1", "unit_price": "10", "discount_pct": "0"},
-        follow_redirects=False,
-    )
-    return inv
-
-
-def test_issued_invoice_reflects_client_changes_or_not(client, db_session):
-    _create_company(client)
-    name_initial = _create_client_via_form(client, "Cliente Inicial")
-    client_obj = db_session.query(Client).filter_by(name=name_initial).first()
-    invoice = _create_invoice_with_line(client, db_session, date(2026, 1, 1), client_obj)
+    # Client and line cascade from the invoice, so everything lands in one flush.
+    db_session.add_all([Company(name="Comp A", tax_id="TA"), invoice])
+    db_session.commit()
+    return invoice
+
+
+@pytest.mark.parametrize(
+    "initial_name, edit_body, new_name",
+    [
+        ("Cliente Inicial", _RENAME_MODIFICADO, "Cliente Modificado"),
+        ("Cliente Snapshot", _RENAME_CAMBIADO, "Cliente Cambiado"),
+    ],
+    ids=["modificado", "cambiado"],
+)
+def test_issued_invoice_does_not_reflect_client_changes_after_snapshot(
+    client, db_session, initial_name, edit_body, new_name
+):
+    invoice = _seed_invoice(db_session, date(2026, 1, 1), initial_name)
     client.post(f"/invoices/{invoice.id}/issue", follow_redirects=False)
 
     resp_before = client.get(f"/invoices/{invoice.id}")
     assert resp_before.status_code == 200
-    assert "Cliente Inicial" in resp_before.text
+    assert initial_name in resp_before.text
 
     # Edit client name
-    client.post(
-        f"/clients/{client_obj.id}/edit",
-        data={
-            "name": "Cliente Modificado",
-            "tax_id": "TX2",
-            "address_line1": "",
-            "address_line2": "",
-            "city": "",
-            "postal_code": "",
-            "country": "",
-            "phone": "",
-            "email": "",
-            "payment_terms_days": "",
-        },
+    resp = client.post(
+        f"/clients/{invoice.client_id}/edit",
+        content=edit_body,
+        headers=_FORM_HEADERS,
         follow_redirects=False,
     )
+    assert resp.status_code in (302, 303)
+    db_session.expire_all()
+    assert db_session.get(Client, invoice.client_id).name == new_name
     resp_after = client.get(f"/invoices/{invoice.id}")
     assert resp_after.status_code == 200
-    # Snapshot: no refleja el cambio
-    assert "Cliente Inicial" in resp_after.text
-    assert "Cliente Modificado" not in resp_after.text
+    # Esperado tras snapshot: NO refleja el cambio
+    assert initial_name in resp_after.text
+    assert new_name not in resp_after.text
 
 
 def test_issued_invoice_reflects_company_changes_or_not(client, db_session):
-    _create_company(client)
-    name_initial = _create_client_via_form(client, "Cliente Cia")
-    client_obj = db_session.query(Client).filter_by(name=name_initial).first()
-    invoice = _create_invoice_with_line(client, db_session, date(2026, 1, 1), client_obj)
+    invoice = _seed_invoice(db_session, date(2026, 1, 1), "Cliente Cia")
     client.post(f"/invoices/{invoice.id}/issue", follow_redirects=False)
 
     resp_before = client.get(f"/invoices/{invoice.id}")
@@ -142,87 +121,29 @@ def test_issued_invoice_reflects_company_changes_or_not(client, db_session):
     assert "Comp Modificada" not in resp_after.text
 
 
-def test_issued_invoice_totals_are_computed_live(client, db_session):
-    _create_company(client)
-    name_initial = _create_client_via_form(client, "Cliente Totales")
-    client_obj = db_session.query(Client).filter_by(name=name_initial).first()
-    invoice = _create_invoice_with_line(client, db_session, date(2026, 1, 1), client_obj)
+def test_issued_invoice_lines_are_live_but_totals_are_snapshot(client, db_session):
+    invoice = _seed_invoice(db_session, date(2026, 1, 1), "Cliente Totales")
     client.post(f"/invoices/{invoice.id}/issue", follow_redirects=False)
 
     resp_before = client.get(f"/invoices/{invoice.id}")
     assert resp_before.status_code == 200
     assert "10.00" in resp_before.text
 
-    # Modificamos la línea directamente en DB para ver si la vista refleja cambio (live computation)
+    # Modificamos la línea directamente en DB tras emitir la factura
     line = db_session.query(InvoiceLine).filter_by(invoice_id=invoice.id).first()
     line.unit_price = 20
     db_session.commit()
 
     resp_after = client.get(f"/invoices/{invoice.id}")
     assert resp_after.status_code == 200
-    # Si se calcula en vivo desde líneas, debería reflejar 20.00; si estuviera persistido, seguiría 10.00
+    # Las líneas se calculan en vivo y muestran 20.00...
     assert "20.00" in resp_after.text
-
-
-def test_issued_invoice_does_not_reflect_client_changes_after_snapshot(client, db_session):
-    _create_company(client)
-    name_initial = _create_client_via_form(client, "Cliente Snapshot")
-    client_obj = db_session.query(Client).filter_by(name=name_initial).first()
-    invoice = _create_invoice_with_line(client, db_session, date(2026, 1, 1), client_obj)
-    client.post(f"/invoices/{invoice.id}/issue", follow_redirects=False)
-    resp_before = client.get(f"/invoices/{invoice.id}")
-    assert resp_before.status_code == 200
-    assert "Cliente Snapshot" in resp_before.text
-
-    client.post(
-        f"/clients/{client_obj.id}/edit",
-        data={
-            "name": "Cliente Cambiado",
-            "tax_id": "TX3",
-            "address_line1": "",
-            "address_line2": "",
-            "city": "",
-            "postal_code": "",
-            "country": "",
-            "phone": "",
-            "email": "",
-            "payment_terms_days": "",
-        },
-        follow_redirects=False,
-    )
-    resp_after = client.get(f"/invoices/{invoice.id}")
-    assert resp_after.status_code == 200
-    # Esperado tras snapshot: NO refleja el cambio
-    assert "Cliente Snapshot" in resp_after.text
-    assert "Cliente Cambiado" not in resp_after.text
-
-
-def test_issued_invoice_totals_do_not_change_if_lines_change(client, db_session):
-    _create_company(client)
-    name_initial = _create_client_via_form(client, "Cliente Totales Snapshot")
-    client_obj = db_session.query(Client).filter_by(name=name_initial).first()
-    invoice = _create_invoice_with_line(client, db_session, date(2026, 1, 1), client_obj)
-    client.post(f"/invoices/{invoice.id}/issue", follow_redirects=False)
-
-    resp_before = client.get(f"/invoices/{invoice.id}")
-    assert resp_before.status_code == 200
-    assert "10.00" in resp_before.text
-
-    line = db_session.query(InvoiceLine).filter_by(invoice_id=invoice.id).first()
-    line.unit_price = 20
-    db_session.commit()
-
-    resp_after = client.get(f"/invoices/{invoice.id}")
-    assert resp_after.status_code == 200
-    # Tras snapshot, el total debería permanecer en 10.00
+    # ...pero el total emitido sigue siendo el snapshot de 10.00
     assert "Total: 10.00" in resp_after.text
 
 
 def test_reissue_does_not_recompute_snapshot(client, db_session):
-    _create_company(client)
-    name_initial = _create_client_via_form(client, "Cliente Reissue")
-    client_obj = db_session.query(Client).filter_by(name=name_initial).first()
-    invoice = _create_invoice_with_line(client, db_session, date(2026, 1, 1), client_obj)
+    invoice = _seed_invoice(db_session, date(2026, 1, 1), "Cliente Reissue")
     client.post(f"/invoices/{invoice.id}/issue", follow_redirects=False)
     resp_first = client.get(f"/invoices/{invoice.id}")
     assert "10.00" in resp_first.text